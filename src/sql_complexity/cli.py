@@ -2,35 +2,126 @@
 Command line interface
 """
 
+from __future__ import annotations
+
+import hashlib
 import sys
 from importlib import metadata
+from itertools import groupby
+from typing import TYPE_CHECKING
 
 import click
-from rich.console import Console
-from rich.syntax import Syntax
+from click.core import ParameterSource
 
 from sql_complexity import SQLComplexityAssessment
 
-out = Console()
-err = Console(stderr=True)
+if TYPE_CHECKING:
+    from rich.console import Console
+
+
+# rich (and pygments for --verbose) is only imported when its output is
+# shown to someone, piped runs just print the total
+def _console(stderr: bool = False) -> Console:
+    """A rich console, importing rich on first use"""
+    from rich.console import Console  # pylint: disable=import-outside-toplevel
+
+    return Console(stderr=stderr)
+
+
+def _print_sql(console: Console, contents: str) -> None:
+    """Print highlighted SQL, importing pygments on first use"""
+    from rich.syntax import Syntax  # pylint: disable=import-outside-toplevel
+
+    console.print(Syntax(contents, lexer="sql"))
+
+
+def _split_statements(contents: str) -> list[str]:
+    """Split a batch into queries on ``;``, as sqlglot tokenizes it
+
+    Semicolons inside strings or comments don't split, and parts without
+    any SQL token (e.g. a trailing comment) are dropped.
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from sqlglot.tokens import Tokenizer, TokenType
+
+    try:
+        tokens = Tokenizer().tokenize(contents)
+    except Exception as e:
+        raise click.ClickException(f"Failed to tokenize SQL: {e}") from e
+
+    statements = []
+    for separator, group in groupby(
+        tokens, key=lambda token: token.token_type == TokenType.SEMICOLON
+    ):
+        if not separator:
+            statement = list(group)
+            statements.append(contents[statement[0].start : statement[-1].end + 1])
+    return statements
+
+
+def _print_batch(checker: SQLComplexityAssessment, contents: str, jobs: int) -> bool:
+    """Print a "<query hash>\t<total>" line per query, False if any failed
+
+    Unparsable queries get "ERROR" as total and their error on stderr.
+    """
+    ok = True
+    sqls = _split_statements(contents)
+    results = checker.assess_many(sqls, workers=jobs, return_exceptions=True)
+    for sql, result in zip(sqls, results):
+        digest = hashlib.sha1(sql.encode()).hexdigest()[:12]
+        if isinstance(result, ValueError):
+            ok = False
+            click.echo(f"{digest}\tERROR")
+            click.echo(f"{digest}: {result}", err=True)
+        else:
+            click.echo(f"{digest}\t{result.total}")
+    return ok
 
 
 @click.command()
 @click.argument("user_input", type=click.File("r"), required=False, default="-")
 @click.option("-v", "--verbose", is_flag=True, help="Enable verbose mode")
+@click.option(
+    "-b",
+    "--batch",
+    is_flag=True,
+    help="Assess several queries, separated by ;",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Processes to assess a --batch with",
+)
 @click.option("-V", "--version", is_flag=True, help="Show version")
-def main(user_input, verbose: bool, version: bool):
+def main(user_input, verbose: bool, batch: bool, jobs: int, version: bool):
     """SQL Complexity assessment"""
     if version:
-        out.print(metadata.version("sql-complexity"))
+        click.echo(metadata.version("sql-complexity"))
         sys.exit(0)
+    jobs_source = click.get_current_context().get_parameter_source("jobs")
+    if not batch and jobs_source != ParameterSource.DEFAULT:
+        raise click.UsageError("--jobs only applies to --batch")
+    if verbose and batch:
+        raise click.UsageError("--verbose can't be combined with --batch")
     if sys.stdin.isatty():
-        err.print("[bold green]Running in interactive mode[/bold green]")
+        _console(stderr=True).print(
+            "[bold green]Running in interactive mode[/bold green]"
+        )
     contents = user_input.read().strip()
-    if verbose:
-        err.print(Syntax(contents, lexer="sql"))
     checker = SQLComplexityAssessment()
-    score = checker.assess(contents)
-    if verbose:
+    if batch:
+        if not _print_batch(checker, contents, jobs):
+            sys.exit(1)
+    elif verbose:
+        out = _console()
+        _print_sql(_console(stderr=True), contents)
+        score = checker.assess(contents)
         out.print(score)
-    out.print(score.total)
+        out.print(score.total)
+    elif sys.stdout.isatty():
+        _console().print(checker.assess(contents).total)
+    else:
+        click.echo(checker.assess(contents).total)
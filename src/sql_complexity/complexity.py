@@ -1,11 +1,45 @@
-from dataclasses import dataclass
-from typing import Optional
+from __future__ import annotations
 
-from sqlglot import exp, parse_one
-from sqlglot.expressions import Expression
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from itertools import repeat
+from operator import mul
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    Optional,
+    Union,
+    cast,
+    overload,
+)
 
+# sqlglot is slow to import, it's loaded on first use by _ensure_sqlglot()
+if TYPE_CHECKING:
+    from sqlglot import exp, parse_one
+    from sqlglot.expressions import Expression
 
-@dataclass
+
+def _sumprod(p: Iterable[int], q: Iterable[int]) -> int:
+    """Sum of products of two iterables, for Python < 3.12"""
+    return sum(map(mul, p, q))
+
+
+# math.sumprod is typed as returning float, looking it up by name keeps the
+# int signature (which mypyc relies on when compiling this module)
+sumprod: Callable[[Iterable[int], Iterable[int]], int] = getattr(
+    math, "sumprod", _sumprod
+)
+
+
+@dataclass(frozen=True, slots=True)
 class ComplexityRules:
     """Configurable complexity scoring rules"""
 
@@ -22,22 +56,57 @@ class ComplexityRules:
     per_case: int = 1
 
     @classmethod
-    def default(cls) -> "ComplexityRules":
+    def default(cls) -> ComplexityRules:
         """Default rules"""
-        return cls()
+        return _DEFAULT_RULES
 
     @classmethod
-    def strict(cls) -> "ComplexityRules":
+    def strict(cls) -> ComplexityRules:
         """Stricter scoring"""
-        return cls(per_outer_join=2, per_function=2, per_case=2)
+        return _STRICT_RULES
 
     @classmethod
-    def lenient(cls) -> "ComplexityRules":
+    def lenient(cls) -> ComplexityRules:
         """More lenient scoring"""
-        return cls(per_join=0, per_function=0)
+        return _LENIENT_RULES
+
+
+# Rules are immutable, so the presets are shared instances
+_DEFAULT_RULES = ComplexityRules()
+_STRICT_RULES = ComplexityRules(per_outer_join=2, per_function=2, per_case=2)
+_LENIENT_RULES = ComplexityRules(per_join=0, per_function=0)
+
+
+# Score counter and the rule that weighs it in the total
+_SCORE_WEIGHTS: tuple[tuple[str, str], ...] = (
+    ("tables", "base_per_table"),
+    ("joins", "per_join"),
+    ("outer_joins", "per_outer_join"),
+    ("where_predicates", "per_where_predicate"),
+    ("having_predicates", "per_having_predicate"),
+    ("ctes", "per_cte"),
+    ("group_by_expressions", "per_group_by_expr"),
+    ("unions", "per_union"),
+    ("intersects", "per_intersect"),
+    ("functions", "per_function"),
+    ("cases", "per_case"),
+)
+
+
+# Number of queries whose parse tree / score is kept around
+_CACHE_SIZE = 1024
 
 
-@dataclass
+@lru_cache(maxsize=_CACHE_SIZE)
+def _parse_cached(sql: str) -> Expression:
+    """Parse SQL, reusing the tree for repeated queries.
+
+    The returned tree is shared between callers and must not be mutated.
+    """
+    return cast("Expression", parse_one(sql))
+
+
+@dataclass(slots=True)
 class ComplexityScore:
     """Breakdown of complexity score"""
 
@@ -71,103 +140,401 @@ class ComplexityScore:
         )
 
 
+_OUTER_JOIN_KINDS = frozenset(("OUTER", "LEFT", "RIGHT", "FULL"))
+
+# Handlers update the score for a node. WHERE/HAVING handlers return the
+# name of the counter that the predicates under the clause add to.
+Handler = Callable[[ComplexityScore, "Expression"], Optional[str]]
+
+
+def _count_table(score: ComplexityScore, _node: Expression) -> None:
+    score.tables += 1
+
+
+def _count_cte(score: ComplexityScore, _node: Expression) -> None:
+    score.ctes += 1
+
+
+def _count_join(score: ComplexityScore, node: Expression) -> None:
+    # Check if it's an outer join
+    if node.args.get("kind") in _OUTER_JOIN_KINDS:
+        score.outer_joins += 1
+    else:
+        score.joins += 1
+
+
+def _count_where(_score: ComplexityScore, _node: Expression) -> str:
+    return "where_predicates"
+
+
+def _count_having(_score: ComplexityScore, _node: Expression) -> str:
+    return "having_predicates"
+
+
+def _count_group(score: ComplexityScore, node: Expression) -> None:
+    score.group_by_expressions += len(node.expressions)
+
+
+def _count_union(score: ComplexityScore, _node: Expression) -> None:
+    score.unions += 1
+
+
+def _count_intersect(score: ComplexityScore, _node: Expression) -> None:
+    score.intersects += 1
+
+
+def _count_function(score: ComplexityScore, _node: Expression) -> None:
+    score.functions += 1
+
+
+def _count_case(score: ComplexityScore, _node: Expression) -> None:
+    score.cases += 1
+
+
+# Node classes and their handlers, checked in order so the first matching
+# base class wins. sqlglot models some nodes as subclasses of others (e.g.
+# CASE is a function), so the order decides which counter they land in.
+# Filled in by _ensure_sqlglot(), like the globals below.
+_NODE_HANDLERS: tuple[tuple[type, Handler], ...] = ()
+# Whether the nodes of a simple SELECT, besides the table, WHERE and
+# AND/OR, are uncounted, as the fast path assumes
+_FAST_PATH_SAFE = False
+_SQL_KEYWORDS: frozenset[str] = frozenset()
+# Base class of all AST nodes, Expression or the Expr above it in newer
+# sqlglot versions
+_NODE_BASE: type
+
+
+def _ensure_sqlglot() -> None:
+    """Import sqlglot and build the tables that depend on it, once"""
+    # pylint: disable=global-statement,import-outside-toplevel,redefined-outer-name
+    global exp, parse_one, _NODE_HANDLERS, _FAST_PATH_SAFE, _SQL_KEYWORDS, _NODE_BASE
+    if _NODE_HANDLERS:
+        return
+
+    from sqlglot import exp, parse_one
+    from sqlglot.parser import Parser
+    from sqlglot.tokens import Tokenizer
+
+    # Reserved words, plus names parsed as functions without parentheses
+    # that aren't tokenizer keywords (e.g. IF, CONNECT_BY_ROOT)
+    _SQL_KEYWORDS = frozenset(Tokenizer.KEYWORDS).union(
+        Parser.NO_PAREN_FUNCTION_PARSERS
+    )
+    # Newer sqlglot versions have Expr above Expression
+    _NODE_BASE = getattr(exp, "Expr", exp.Expression)
+    _NODE_HANDLERS = (
+        (exp.Table, _count_table),
+        (exp.CTE, _count_cte),
+        (exp.Join, _count_join),
+        (exp.Where, _count_where),
+        (exp.Having, _count_having),
+        (exp.Group, _count_group),
+        (exp.Union, _count_union),
+        (exp.Intersect, _count_intersect),
+        (exp.Func, _count_function),
+        (exp.Case, _count_case),
+    )
+    _FAST_PATH_SAFE = not any(
+        _resolve_handler(cls)
+        for cls in (
+            exp.Select,
+            exp.From,
+            exp.TableAlias,
+            exp.Column,
+            exp.Identifier,
+            exp.Star,
+            exp.Literal,
+            exp.Boolean,
+            exp.Null,
+            exp.EQ,
+            exp.NEQ,
+            exp.LT,
+            exp.LTE,
+            exp.GT,
+            exp.GTE,
+        )
+    )
+
+
+def _resolve_handler(cls: type) -> Optional[Handler]:
+    """Find the handler for a concrete node class, if any"""
+    for base, handler in _NODE_HANDLERS:
+        if issubclass(cls, base):
+            return handler
+    return None
+
+
+_SIMPLE_TOKEN = re.compile(
+    r"\s*(?:(?P<literal>'[^'\\]*'|\d+(?:\.\d+)?(?![A-Za-z0-9_]))"
+    r"|(?P<name>[A-Za-z_][A-Za-z0-9_]*)"
+    r"|(?P<symbol><>|!=|<=|>=|[=<>,.*]))"
+)
+_SIMPLE_KEYWORDS = frozenset(("SELECT", "FROM", "WHERE", "AND", "OR", "AS"))
+_LITERAL_KEYWORDS = frozenset(("TRUE", "FALSE", "NULL"))
+# Grammar of a simple SELECT over the token kinds from _simple_select_tokens:
+# plain columns from one table, comparisons joined by AND/OR
+_SIMPLE_COLUMN = r"(?:\*|name(?: \. name)?)"
+_SIMPLE_OPERAND = r"(?:literal|name(?: \. name)?)"
+_SIMPLE_PREDICATE = rf"{_SIMPLE_OPERAND} (?:=|<>|!=|<|<=|>|>=) {_SIMPLE_OPERAND}"
+_SIMPLE_SELECT = re.compile(
+    rf"SELECT {_SIMPLE_COLUMN}(?: , {_SIMPLE_COLUMN})*"
+    r" FROM name(?: \. name)?(?: (?:AS )?name)?"
+    rf"(?: WHERE {_SIMPLE_PREDICATE}(?: (?:AND|OR) {_SIMPLE_PREDICATE})*)?"
+)
+
+
+def _simple_select_tokens(sql: str) -> Optional[list[str]]:
+    """Token kinds of a simple SELECT, None for anything else"""
+    tokens = []
+    pos, end = 0, len(sql.rstrip())
+    while pos < end:
+        match = _SIMPLE_TOKEN.match(sql, pos)
+        if match is None:
+            return None
+        name = match["name"]
+        if name is None:
+            tokens.append("literal" if match["literal"] else match["symbol"])
+        else:
+            keyword = name.upper()
+            if keyword in _SIMPLE_KEYWORDS:
+                tokens.append(keyword)
+            elif keyword in _LITERAL_KEYWORDS:
+                tokens.append("literal")
+            elif keyword in _SQL_KEYWORDS:
+                # e.g. CURRENT_DATE is a function call without parentheses
+                return None
+            else:
+                tokens.append("name")
+        pos = match.end()
+    if _SIMPLE_SELECT.fullmatch(" ".join(tokens)) is None:
+        return None
+    return tokens
+
+
 class SQLComplexityAssessment:
     """Assess SQL query complexity based on configurable rules"""
 
+    # Handler per concrete node class, filled in as new classes are seen
+    # so each class goes through the subclass checks only once. Keying on
+    # type(node) is cheaper than on sqlglot's ``node.key`` tag, which is
+    # looked up through the instance first.
+    _HANDLERS: dict[type, Optional[Handler]] = {}
+
     def __init__(self, rules: Optional[ComplexityRules] = None):
-        self.rules = rules or ComplexityRules.default()
+        self._rules = rules or _DEFAULT_RULES
+        # Counters that contribute to the total, with their weights
+        weighted = [
+            (field, getattr(self._rules, rule))
+            for field, rule in _SCORE_WEIGHTS
+            if getattr(self._rules, rule)
+        ]
+        self._weighted_fields = tuple(field for field, _ in weighted)
+        self._weights = tuple(weight for _, weight in weighted)
+        # Scores of recently assessed queries, least recently used first
+        self._results: OrderedDict[str, ComplexityScore] = OrderedDict()
+        # Guards _results, so threads can share an assessor
+        self._results_lock = threading.Lock()
+
+    @property
+    def rules(self) -> ComplexityRules:
+        """Scoring rules, fixed at construction as the weights derive from them"""
+        return self._rules
 
     def assess(self, sql: str) -> ComplexityScore:
         """Assess complexity of SQL query"""
-        try:
-            parsed = parse_one(sql)
-        except Exception as e:
-            raise ValueError(f"Failed to parse SQL: {e}") from e
+        _ensure_sqlglot()
+        results = self._results
+        with self._results_lock:
+            score = results.get(sql)
+            if score is not None:
+                results.move_to_end(sql)
+        if score is not None:
+            return replace(score)
 
-        score = ComplexityScore()
-        self._assess_node(parsed, score)
+        score = self._try_fast_path(sql)
+        if score is None:
+            try:
+                parsed = _parse_cached(sql)
+            except Exception as e:
+                raise ValueError(f"Failed to parse SQL: {e}") from e
+
+            score = ComplexityScore()
+            self._assess_node(parsed, score)
         self._calculate_total(score)
-        return score
+        with self._results_lock:
+            results[sql] = score
+            if len(results) > _CACHE_SIZE:
+                results.popitem(last=False)
+        return replace(score)
 
-    def _assess_node(self, node: Expression, score: ComplexityScore) -> None:
-        """Recursively assess complexity of AST node"""
-
-        # Count tables
-        if isinstance(node, exp.Table):
-            score.tables += 1
-
-        # Count CTEs
-        elif isinstance(node, exp.CTE):
-            score.ctes += 1
-
-        # Count joins
-        elif isinstance(node, exp.Join):
-            # Check if it's an outer join
-            if (
-                node.args.get("kind") == "OUTER"
-                or node.args.get("kind") == "LEFT"
-                or node.args.get("kind") == "RIGHT"
-                or node.args.get("kind") == "FULL"
-            ):
-                score.outer_joins += 1
-            else:
-                score.joins += 1
-
-        # Count WHERE predicates
-        elif isinstance(node, exp.Where):
-            score.where_predicates += self._count_predicates(node.this)
-
-        # Count HAVING predicates
-        elif isinstance(node, exp.Having):
-            score.having_predicates += self._count_predicates(node.this)
-
-        # Count GROUP BY expressions
-        elif isinstance(node, exp.Group):
-            score.group_by_expressions += len(node.expressions)
-
-        # Count UNION/INTERSECT
-        elif isinstance(node, exp.Union):
-            score.unions += 1
-        elif isinstance(node, exp.Intersect):
-            score.intersects += 1
-
-        # Count function calls
-        elif isinstance(node, exp.Func):
-            score.functions += 1
-
-        # Count CASE expressions
-        elif isinstance(node, exp.Case):
-            score.cases += 1
-
-        # Recursively process children
-        for child in node.iter_expressions():
-            self._assess_node(child, score)
-
-    def _count_predicates(self, node: Expression) -> int:
-        """Count AND/OR predicates"""
-        if node is None:
-            return 0
-
-        if isinstance(node, (exp.And, exp.Or)):
-            return (
-                1
-                + self._count_predicates(node.left)
-                + self._count_predicates(node.right)
+    @overload
+    def assess_many(
+        self,
+        sqls: Iterable[str],
+        workers: int = 1,
+        return_exceptions: Literal[False] = False,
+    ) -> Iterator[ComplexityScore]: ...
+
+    @overload
+    def assess_many(
+        self,
+        sqls: Iterable[str],
+        workers: int = 1,
+        *,
+        return_exceptions: Literal[True],
+    ) -> Iterator[Union[ComplexityScore, ValueError]]: ...
+
+    def assess_many(
+        self,
+        sqls: Iterable[str],
+        workers: int = 1,
+        return_exceptions: bool = False,
+    ) -> Iterator[Union[ComplexityScore, ValueError]]:
+        """Assess complexity of several SQL queries, in order
+
+        Queries share this assessor's caches, so repeated ones are cheap.
+        With ``workers`` > 1 they are spread over that many processes, each
+        with its own assessor for the same rules. With ``return_exceptions``
+        a query that fails to parse yields its ValueError instead of a score,
+        rather than ending the iteration.
+        """
+        if workers <= 1:
+            for sql in sqls:
+                yield _assess(self, sql, return_exceptions)
+            return
+
+        # pylint: disable-next=import-outside-toplevel
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(self.rules,),
+        ) as executor:
+            yield from executor.map(
+                _assess_in_worker, sqls, repeat(return_exceptions), chunksize=32
             )
-        return 1
+
+    def cache_clear(self) -> None:
+        """Drop this assessor's cached scores and all cached parse trees"""
+        with self._results_lock:
+            self._results.clear()
+        _parse_cached.cache_clear()
+
+    # Locals bind lookups once for the per-node loop
+    # pylint: disable-next=too-many-locals
+    def _assess_node(self, root: Expression, score: ComplexityScore) -> None:
+        """Assess complexity of every node in the AST rooted at ``root``
+
+        Uses an explicit stack so deeply nested queries can't exhaust the
+        interpreter's recursion limit. ``Expression.walk()`` runs the same
+        loop behind a generator, which adds a resume per node and measured
+        slower, so the stack is kept inline here.
+        """
+        handlers = self._HANDLERS
+        resolve_handler = self._resolve_handler
+        connectors = (exp.And, exp.Or)
+        node_base = _NODE_BASE
+        # Any, the nodes are _NODE_BASE instances whichever class that is
+        stack: list[Any] = [root]
+        # Predicate counter for each pending stack entry; None when the node
+        # isn't an operand of a WHERE/HAVING clause. AND/OR pass it on.
+        counters: list[Optional[str]] = [None]
+        # Bound once, the loop runs for every node in the tree
+        stack_pop, stack_append = stack.pop, stack.append
+        counters_pop, counters_append = counters.pop, counters.append
+        while stack:
+            node = stack_pop()
+            counter = counters_pop()
+            cls = type(node)
+            if counter is not None:
+                setattr(score, counter, getattr(score, counter) + 1)
+                if cls not in connectors:
+                    counter = None
+            try:
+                handler = handlers[cls]
+            except KeyError:
+                handler = handlers[cls] = resolve_handler(cls)
+            if handler is not None:
+                clause = handler(score, node)
+                if clause is not None:
+                    counter = clause
+
+            # Process children, reading args directly is cheaper than the
+            # iter_expressions() generator
+            for value in node.args.values():
+                # Args only hold plain lists, the exact check is cheaper
+                # pylint: disable-next=unidiomatic-typecheck
+                if type(value) is list:
+                    for child in value:
+                        if isinstance(child, node_base):
+                            stack_append(child)
+                            counters_append(counter)
+                elif isinstance(value, node_base):
+                    stack_append(value)
+                    counters_append(counter)
+
+    def _try_fast_path(self, sql: str) -> Optional[ComplexityScore]:
+        """Score a trivial single table SELECT without parsing it
+
+        Returns None when the query isn't simple enough to be sure of the
+        result, so it has to go through sqlglot.
+        """
+        if not _FAST_PATH_SAFE:
+            return None
+        tokens = _simple_select_tokens(sql)
+        if tokens is None:
+            return None
+
+        score = ComplexityScore()
+        score.tables = 1
+        if "WHERE" in tokens:
+            connectors = tokens.count("AND") + tokens.count("OR")
+            # n connectors join n + 1 comparisons, each one a predicate
+            score.where_predicates = 2 * connectors + 1
+        if self._resolve_handler(exp.And) is _count_function:
+            score.functions += tokens.count("AND")
+        if self._resolve_handler(exp.Or) is _count_function:
+            score.functions += tokens.count("OR")
+        return score
+
+    def _resolve_handler(self, cls: type) -> Optional[Handler]:
+        """Find the handler for a node class, caching it for the class"""
+        try:
+            return self._HANDLERS[cls]
+        except KeyError:
+            handler = self._HANDLERS[cls] = _resolve_handler(cls)
+            return handler
 
     def _calculate_total(self, score: ComplexityScore) -> None:
         """Calculate total score based on rules"""
-        score.total = (
-            score.tables * self.rules.base_per_table
-            + score.joins * self.rules.per_join
-            + score.outer_joins * self.rules.per_outer_join
-            + score.where_predicates * self.rules.per_where_predicate
-            + score.having_predicates * self.rules.per_having_predicate
-            + score.ctes * self.rules.per_cte
-            + score.group_by_expressions * self.rules.per_group_by_expr
-            + score.unions * self.rules.per_union
-            + score.intersects * self.rules.per_intersect
-            + score.functions * self.rules.per_function
-            + score.cases * self.rules.per_case
-        )
+        counts = [getattr(score, field) for field in self._weighted_fields]
+        score.total = sumprod(counts, self._weights)
+
+
+# Assessor of the current worker process, see assess_many()
+_WORKER_ASSESSOR: Optional[SQLComplexityAssessment] = None
+
+
+def _init_worker(rules: ComplexityRules) -> None:
+    global _WORKER_ASSESSOR  # pylint: disable=global-statement
+    _WORKER_ASSESSOR = SQLComplexityAssessment(rules)
+
+
+def _assess(
+    assessor: SQLComplexityAssessment, sql: str, return_exceptions: bool
+) -> Union[ComplexityScore, ValueError]:
+    try:
+        return assessor.assess(sql)
+    except ValueError as e:
+        if return_exceptions:
+            return e
+        raise
+
+
+def _assess_in_worker(
+    sql: str, return_exceptions: bool
+) -> Union[ComplexityScore, ValueError]:
+    assert _WORKER_ASSESSOR is not None
+    return _assess(_WORKER_ASSESSOR, sql, return_exceptions)
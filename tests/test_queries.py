@@ -1,4 +1,8 @@
-from sql_complexity import SQLComplexityAssessment, ComplexityRules
+import pytest
+from click.testing import CliRunner
+
+from sql_complexity import SQLComplexityAssessment, ComplexityRules, complexity
+from sql_complexity.cli import main
 
 
 def test_simple():
@@ -41,3 +45,119 @@ def test_complex():
     assessor = SQLComplexityAssessment()
     score = assessor.assess(complex_sql)
     assert score.total == 25
+
+
+def test_repeated_query_is_cached():
+    # Has a join, so it's parsed rather than taking the fast path
+    sql = "SELECT a FROM t JOIN u ON t.id = u.id WHERE a = 1 AND b = 2"
+    assessor = SQLComplexityAssessment()
+    assessor.cache_clear()
+    first = assessor.assess(sql)
+    total = first.total
+    first.total = 0
+    second = assessor.assess(sql)
+
+    # Served from the result cache, without parsing again or a parse cache hit
+    info = complexity._parse_cached.cache_info()
+    assert (info.misses, info.hits) == (1, 0)
+    assert second.total == total
+    assert second is not first
+
+
+def test_deeply_nested_predicates():
+    conditions = " OR ".join(f"a = {i}" for i in range(3000))
+    assessor = SQLComplexityAssessment()
+    score = assessor.assess(f"SELECT * FROM t WHERE {conditions}")
+
+    assert score.where_predicates == 2 * 3000 - 1
+
+
+def test_zero_weighted_items_are_counted():
+    sql = "SELECT UPPER(name) FROM users WHERE LOWER(name) = 'x'"
+    assessor = SQLComplexityAssessment(ComplexityRules.lenient())
+    score = assessor.assess(sql)
+
+    assert score.functions == 2
+    assert score.total == 2
+
+
+def test_simple_selects():
+    assessor = SQLComplexityAssessment()
+    assessor.cache_clear()
+
+    assert assessor.assess("SELECT * FROM users").total == 1
+    assert (
+        assessor.assess("SELECT u.id FROM app.users AS u WHERE u.x <> 'OR'").total == 2
+    )
+    # 3 comparisons, 2 connectors (counted as predicates and as functions)
+    assert assessor.assess("SELECT a FROM t WHERE a = 1 AND b = 2 OR c = 3").total == 8
+    # Scored without parsing
+    assert complexity._parse_cached.cache_info().misses == 0
+    # CURRENT_DATE is a function call even without parentheses
+    assert assessor.assess("SELECT current_date FROM t WHERE a = 1").total == 3
+    assert complexity._parse_cached.cache_info().misses == 1
+
+
+def test_assess_many():
+    assessor = SQLComplexityAssessment()
+    sqls = ["SELECT 1", "SELECT id FROM users", "SELECT 1"]
+    totals = [score.total for score in assessor.assess_many(sqls)]
+
+    assert totals == [0, 1, 0]
+
+
+def test_assess_many_in_processes():
+    assessor = SQLComplexityAssessment(ComplexityRules.strict())
+    sqls = ["SELECT COUNT(*) FROM users", "SELECT id FROM users"] * 40
+    scores = list(assessor.assess_many(sqls, workers=2))
+
+    assert [score.total for score in scores] == [3, 1] * 40
+
+
+def test_chained_set_operations():
+    sql = """
+    SELECT 1 UNION SELECT 2 UNION ALL SELECT 3
+    UNION (SELECT 4 INTERSECT SELECT 5 INTERSECT SELECT 6)
+    """
+    score = SQLComplexityAssessment().assess(sql)
+
+    assert score.unions == 3
+    assert score.intersects == 2
+
+
+def test_rules_are_read_only():
+    assessor = SQLComplexityAssessment()
+
+    with pytest.raises(AttributeError):
+        assessor.rules = ComplexityRules.strict()
+    assert assessor.assess("SELECT COUNT(*) FROM t").total == 2
+
+
+def test_no_paren_function_names_are_parsed():
+    assessor = SQLComplexityAssessment()
+
+    with pytest.raises(ValueError):
+        assessor.assess("SELECT a FROM t WHERE if = 1")
+
+
+def test_batch_cli():
+    queries = """
+    SELECT a
+    FROM t
+    WHERE b = 'x;y';
+    SELECT a FROM;
+    SELECT 1
+    """
+    result = CliRunner().invoke(main, ["--batch"], input=queries)
+
+    assert result.exit_code == 1
+    lines = [line.split("\t") for line in result.stdout.splitlines()]
+    assert [total for _, total in lines] == ["2", "ERROR", "0"]
+    assert "Failed to parse SQL" in result.stderr
+
+
+@pytest.mark.parametrize("args", [["--jobs", "1"], ["--batch", "--verbose"]])
+def test_cli_rejects_option_combinations(args):
+    result = CliRunner().invoke(main, args, input="SELECT 1")
+
+    assert result.exit_code == 2